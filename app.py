@@ -1,9 +1,14 @@
 import io
+import numpy as np
 import pandas as pd
 import streamlit as st
 import altair as alt
 
-from scheduling import optimize_schedule
+from scheduling import build_model, solve_model
+
+
+# Large tables are truncated to this many rows before being sent to the browser.
+MAX_PREVIEW_ROWS = 200
 
 
 st.set_page_config(page_title="NurseShiftly", layout="wide")
@@ -29,6 +34,7 @@ st.markdown(
     - **Overtime cost weight**: penalty per overtime hour. Higher = avoid overtime unless necessary; lower = use overtime more freely. Setting to 0 makes overtime “free” (still limited by availability/skills).
     - **Understaff penalty weight**: penalty per unfilled nurse slot on a shift (when understaffing is allowed). Higher = prioritize covering demand; lower = tolerate gaps if cheaper than overtime. Setting to 0 means the model won’t try to close gaps beyond hard constraints.
     - **Preference weight**: reward per unit of preference score for assigning a nurse to a shift. Higher = favor high-score matches. Set to 0 to ignore preferences.
+    - **Try LP relaxation first**: solves the relaxed model and keeps it when every assignment is already 0/1, which is common when capacity comfortably exceeds demand. Falls back to the full model otherwise.
     """
 )
 
@@ -36,9 +42,58 @@ st.markdown(
 def load_csv(uploaded_file_or_path):
     if uploaded_file_or_path is None:
         return None
+    # pyarrow parses faster than the default C engine and keeps Arrow-backed columns.
     if isinstance(uploaded_file_or_path, str):
-        return pd.read_csv(uploaded_file_or_path)
-    return pd.read_csv(uploaded_file_or_path)
+        return pd.read_csv(uploaded_file_or_path, engine="pyarrow", dtype_backend="pyarrow")
+    return pd.read_csv(uploaded_file_or_path, engine="pyarrow", dtype_backend="pyarrow")
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_schedule_model(nurses_df, shifts_df, availability_df, allow_overtime, allow_understaff, preferences_df):
+    # Variables and constraints only depend on the data and the overtime/understaff switches,
+    # so changing a weight re-solves the cached model instead of rebuilding it.
+    return build_model(
+        nurses_df,
+        shifts_df,
+        availability_df,
+        allow_overtime=allow_overtime,
+        allow_understaff=allow_understaff,
+        preferences_df=preferences_df,
+    )
+
+
+@st.cache_data(show_spinner=False)
+def solve_schedule(
+    nurses_df,
+    shifts_df,
+    availability_df,
+    allow_overtime,
+    overtime_cost,
+    allow_understaff,
+    understaff_penalty,
+    preferences_df,
+    preference_weight,
+    fast_lp,
+):
+    # Cached on the input DataFrames and settings so reruns with unchanged inputs skip the solve.
+    schedule_model = get_schedule_model(
+        nurses_df, shifts_df, availability_df, allow_overtime, allow_understaff, preferences_df
+    )
+    return solve_model(
+        schedule_model,
+        overtime_cost=overtime_cost,
+        understaff_penalty=understaff_penalty,
+        preference_weight=preference_weight,
+        fast_lp=fast_lp,
+    )
+
+
+@st.cache_data(show_spinner=False)
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    # Cached so the download button does not re-serialize an unchanged schedule.
+    buf = io.StringIO()
+    df.to_csv(buf, index=False)
+    return buf.getvalue().encode()
 
 
 with st.sidebar:
@@ -60,6 +115,11 @@ with st.sidebar:
         step=1.0,
         help="Higher values favor assignments with higher preference scores (from preferences.csv).",
     )
+    fast_lp = st.checkbox(
+        "Try LP relaxation first",
+        value=False,
+        help="Solve the faster linear relaxation and keep it when it is already whole-numbered; otherwise solve the full model.",
+    )
 
     st.header("Data")
     nurses_file = st.file_uploader("nurses.csv", type="csv")
@@ -96,34 +156,50 @@ st.write("Nurses")
 st.dataframe(nurses_df)
 st.write("Shifts")
 st.dataframe(shifts_df)
-st.write("Availability")
-st.dataframe(availability_df)
+with st.expander("Show availability", expanded=False):
+    st.caption(f"{len(availability_df)} rows (showing up to {MAX_PREVIEW_ROWS})")
+    st.dataframe(availability_df.head(MAX_PREVIEW_ROWS))
 
 
 if st.button("Generate Schedule"):
     with st.spinner("Solving optimization..."):
-        assignments_df, overtime_dict, unmet_demand, status = optimize_schedule(
+        (
+            assignments_df,
+            overtime_dict,
+            unmet_demand,
+            status,
+            assigned_matrix,
+            nurse_ids,
+            shift_ids,
+            shift_demand,
+        ) = solve_schedule(
             nurses_df,
             shifts_df,
             availability_df,
-            allow_overtime=allow_overtime,
-            overtime_cost=overtime_cost,
-            allow_understaff=allow_understaff,
-            understaff_penalty=understaff_penalty,
-            preferences_df=preferences_df,
-            preference_weight=preference_weight,
+            allow_overtime,
+            overtime_cost,
+            allow_understaff,
+            understaff_penalty,
+            preferences_df,
+            preference_weight,
+            fast_lp,
         )
 
     st.success(f"Solver status: {status}")
 
     st.subheader("Assignments")
-    st.dataframe(assignments_df)
+    if len(assignments_df) > MAX_PREVIEW_ROWS:
+        st.caption(f"Showing first {MAX_PREVIEW_ROWS} of {len(assignments_df)} rows; download the CSV for the full schedule.")
+    st.dataframe(assignments_df.head(MAX_PREVIEW_ROWS), width="stretch")
 
     st.subheader("Demand vs. Coverage")
-    coverage = assignments_df.groupby("shift_id")["assigned"].sum().reset_index()
-    demand = shifts_df[["shift_id", "demand"]]
-    cov = demand.merge(coverage, on="shift_id", how="left").fillna(0)
-    cov = cov.rename(columns={"assigned": "coverage"})
+    cov = pd.DataFrame(
+        {
+            "shift_id": shift_ids,
+            "demand": shift_demand,
+            "coverage": assigned_matrix.sum(axis=0),
+        }
+    )
     cov_melt = cov.melt(id_vars="shift_id", value_vars=["demand", "coverage"], var_name="metric", value_name="value")
     chart = (
         alt.Chart(cov_melt)
@@ -140,29 +216,37 @@ if st.button("Generate Schedule"):
 
     if allow_understaff:
         st.subheader("Unmet Demand (if any)")
-        unmet_df = pd.DataFrame(
-            [{"shift_id": s, "unmet": round(v, 2)} for s, v in unmet_demand.items() if v > 0.0001]
-        )
+        unmet = pd.Series(unmet_demand, dtype="float64")
+        unmet_df = unmet[unmet > 0.0001].round(2).rename_axis("shift_id").reset_index(name="unmet")
         if unmet_df.empty:
             st.write("No unmet demand.")
         else:
             st.dataframe(unmet_df)
 
     st.subheader("Assignment Matrix (Nurses × Shifts)")
-    pivot_df = assignments_df.pivot(index="nurse_id", columns="shift_id", values="assigned").fillna(0).astype(int)
-    st.dataframe(pivot_df)
+    pivot_df = pd.DataFrame(
+        assigned_matrix,
+        index=pd.Index(nurse_ids, name="nurse_id"),
+        columns=pd.Index(shift_ids, name="shift_id"),
+    )
+    if len(pivot_df) > MAX_PREVIEW_ROWS:
+        st.caption(f"Showing first {MAX_PREVIEW_ROWS} of {len(pivot_df)} nurses.")
+    st.dataframe(pivot_df.head(MAX_PREVIEW_ROWS), width="stretch")
 
     st.subheader("Overtime")
     overtime_table = pd.DataFrame(
-        [{"nurse_id": n, "overtime_hours": round(hours, 2)} for n, hours in overtime_dict.items()]
+        {
+            "nurse_id": list(overtime_dict),
+            "overtime_hours": np.round(
+                np.fromiter(overtime_dict.values(), dtype=np.float64, count=len(overtime_dict)), 2
+            ),
+        }
     )
     st.dataframe(overtime_table)
 
-    csv_buffer = io.StringIO()
-    assignments_df.to_csv(csv_buffer, index=False)
     st.download_button(
         "Download Schedule (CSV)",
-        data=csv_buffer.getvalue(),
+        data=to_csv_bytes(assignments_df),
         file_name="optimized_schedule.csv",
         mime="text/csv",
     )
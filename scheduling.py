@@ -1,111 +1,309 @@
+import os
+import threading
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
 import pulp
 
 
-def optimize_schedule(
+def _get_solver(mip: bool = True):
+    """
+    Return the in-process HiGHS solver if highspy is installed, else CBC.
+
+    CBC runs multi-threaded. With ``mip=False`` the integrality of binary
+    variables is ignored.
+    """
+    highs = pulp.HiGHS(mip=mip, msg=False)
+    if highs.available():
+        return highs
+    return pulp.PULP_CBC_CMD(mip=mip, msg=False, threads=os.cpu_count())
+
+
+def _build_feasibility(avail_matrix: np.ndarray, nurse_icu: np.ndarray, shift_icu: np.ndarray) -> np.ndarray:
+    """Boolean nurse x shift mask: available, and ICU-trained wherever the shift requires ICU."""
+    return np.asarray(avail_matrix, dtype=bool) & (~shift_icu[None, :] | nurse_icu[:, None])
+
+
+def _slack_values(vals: dict, slack: dict, keys) -> np.ndarray:
+    """Solved values of a slack dict in ``keys`` order; literal 0 entries (slack disabled) read as 0.0."""
+    return np.fromiter(
+        (
+            (vals.get(var.name) or 0.0) if isinstance(var, pulp.LpVariable) else float(var)
+            for var in (slack[k] for k in keys)
+        ),
+        dtype=np.float64,
+        count=len(keys),
+    )
+
+
+class ScheduleModel(NamedTuple):
+    """Structural part of the scheduling MILP: everything except the objective weights."""
+
+    model: pulp.LpProblem
+    nurses: np.ndarray
+    shifts: np.ndarray
+    x: dict
+    o: dict
+    u: dict
+    preference_lookup: dict
+    # Matrix position of each assignment variable, in ``x`` order
+    nz_nurse: np.ndarray
+    nz_shift: np.ndarray
+    # Demand per shift, aligned to ``shifts``
+    shift_demand: np.ndarray
+    # Serializes solves: solve_model mutates the shared LpProblem in place
+    lock: threading.Lock
+
+
+def build_model(
     nurses_df: pd.DataFrame,
     shifts_df: pd.DataFrame,
     availability_df: pd.DataFrame,
     allow_overtime: bool = True,
-    overtime_cost: float = 10.0,
     allow_understaff: bool = False,
-    understaff_penalty: float = 50.0,
     preferences_df: pd.DataFrame | None = None,
-    preference_weight: float = 0.0,
-):
+) -> ScheduleModel:
     """
-    Build and solve the nurse scheduling MILP.
+    Build the variables and constraints of the nurse scheduling MILP.
 
-    Returns
-    -------
-    assignments_df : pd.DataFrame
-        Columns: nurse_id, shift_id, assigned (0/1)
-    overtime_dict : dict
-        Mapping of nurse_id -> overtime hours (float)
-    status : str
-        PuLP solver status string
+    The objective is left unset; ``solve_model`` fills it in from the weights,
+    so a built model can be re-solved when only the weights change.
     """
     nurses = nurses_df["nurse_id"].unique()
     shifts = shifts_df["shift_id"].unique()
 
-    # Lookups for parameters
-    shift_hours = dict(zip(shifts_df["shift_id"], shifts_df["hours"]))
-    shift_demand = dict(zip(shifts_df["shift_id"], shifts_df["demand"]))
-    shift_skill = dict(zip(shifts_df["shift_id"], shifts_df["required_skill"]))
-    nurse_max_hours = dict(zip(nurses_df["nurse_id"], nurses_df["max_hours_per_week"]))
-    nurse_skill = dict(zip(nurses_df["nurse_id"], nurses_df["skill_level"]))
+    # Parameters aligned to the nurses / shifts ordering (last row wins on duplicate ids).
+    # Right-hand sides are plain lists so indexing them in the constraint loops stays cheap.
+    shift_params = shifts_df.drop_duplicates("shift_id", keep="last").set_index("shift_id").loc[shifts]
+    nurse_params = nurses_df.drop_duplicates("nurse_id", keep="last").set_index("nurse_id").loc[nurses]
+    shift_hours = shift_params["hours"].to_numpy()
+    shift_demand = shift_params["demand"].to_numpy().tolist()
+    nurse_max_hours = nurse_params["max_hours_per_week"].to_numpy().tolist()
+    # Skill labels are uppercased once, vectorized, rather than per (nurse, shift) pair.
+    shift_icu = (shift_params["required_skill"].str.upper() == "ICU").to_numpy(dtype=bool)
+    nurse_icu = (nurse_params["skill_level"].str.upper() == "ICU").to_numpy(dtype=bool)
 
-    availability_lookup = {}
-    for _, row in availability_df.iterrows():
-        availability_lookup[(row["nurse_id"], row["shift_id"])] = int(row["available"])
+    # Dense nurse x shift availability matrix, filled straight from the column
+    # arrays. Rows for unknown nurses/shifts are ignored; missing pairs and
+    # blank "available" cells count as unavailable.
+    nurse_idx = pd.Index(nurses).get_indexer(availability_df["nurse_id"])
+    shift_idx = pd.Index(shifts).get_indexer(availability_df["shift_id"])
+    known = (nurse_idx >= 0) & (shift_idx >= 0)
+    avail_matrix = np.zeros((len(nurses), len(shifts)), dtype=bool)
+    avail_matrix[nurse_idx[known], shift_idx[known]] = (
+        availability_df["available"].fillna(0).to_numpy().astype(int)[known] != 0
+    )
 
+    # Build (nurse_id, shift_id) lookups straight from the column arrays
+    # instead of boxing every row into a Series via iterrows().
     preference_lookup = {}
-    if preferences_df is not None and not preferences_df.empty and preference_weight != 0:
-        for _, row in preferences_df.iterrows():
-            preference_lookup[(row["nurse_id"], row["shift_id"])] = float(row["score"])
+    if preferences_df is not None and not preferences_df.empty:
+        preference_lookup = dict(
+            zip(
+                zip(preferences_df["nurse_id"].to_numpy(), preferences_df["shift_id"].to_numpy()),
+                preferences_df["score"].to_numpy().astype(float).tolist(),
+            )
+        )
+
+    # Feasible (nurse, shift) pairs: the nurse is available and holds the
+    # required skill. Infeasible pairs get no variable at all instead of an
+    # x <= 0 row, which keeps the model small for the solver's presolve.
+    feasible_mask = _build_feasibility(avail_matrix, nurse_icu, shift_icu)
+    nz_nurse, nz_shift = np.nonzero(feasible_mask)
+
+    # Sparse row layout of the constraint matrix. np.nonzero walks the mask
+    # row-major, so variables are already grouped by nurse (CSR for the hour
+    # rows); a stable argsort on the shift index groups them by shift.
+    nurse_ptr = np.concatenate(([0], np.cumsum(np.bincount(nz_nurse, minlength=len(nurses)))))
+    shift_ptr = np.concatenate(([0], np.cumsum(np.bincount(nz_shift, minlength=len(shifts)))))
+    by_shift = np.argsort(nz_shift, kind="stable").tolist()
+    hour_coefs = shift_hours[nz_shift].tolist()
 
     # Model
     model = pulp.LpProblem("NurseShiftly", pulp.LpMinimize)
 
     # Decision variables
-    x = pulp.LpVariable.dicts("assign", (nurses, shifts), lowBound=0, upBound=1, cat="Binary")
-    o = pulp.LpVariable.dicts("overtime", nurses, lowBound=0, cat="Continuous")
-    u = pulp.LpVariable.dicts("unmet", shifts, lowBound=0, cat="Continuous")  # understaffing slack
+    nurse_list = list(nurses)
+    shift_list = list(shifts)
+    feasible = [(nurse_list[i], shift_list[j]) for i, j in zip(nz_nurse.tolist(), nz_shift.tolist())]
+    x_vars = [pulp.LpVariable(f"assign_{n}_{s}", cat="Binary") for n, s in feasible]
+    x = dict(zip(feasible, x_vars))
+    # Overtime and understaffing slacks only exist when allowed; otherwise a
+    # literal 0 stands in so the constraints below need no extra == 0 rows.
+    if allow_overtime:
+        o = pulp.LpVariable.dicts("overtime", nurses, lowBound=0, cat="Continuous")
+    else:
+        o = {n: 0 for n in nurses}
+    if allow_understaff:
+        u = pulp.LpVariable.dicts("unmet", shifts, lowBound=0, cat="Continuous")  # understaffing slack
+    else:
+        u = {s: 0 for s in shifts}
 
-    # Objective: minimize total overtime + understaff penalty
-    # Preference scores act as a reward (subtracted from the objective).
-    model += (
-        pulp.lpSum(overtime_cost * o[n] for n in nurses)
-        + pulp.lpSum(understaff_penalty * u[s] for s in shifts)
-        - pulp.lpSum(
-            preference_weight * preference_lookup.get((n, s), 0.0) * x[n][s]
-            for n in nurses
-            for s in shifts
+    # Constraints: each row's expression is assembled straight from its slice
+    # of (variable, coefficient) pairs rather than summing per-term expressions.
+    # Shift coverage
+    for j, s in enumerate(shift_list):
+        row = pulp.LpAffineExpression(
+            (x_vars[k], 1) for k in by_shift[shift_ptr[j] : shift_ptr[j + 1]]
         )
+        model += row + u[s] >= shift_demand[j], f"coverage_{s}"
+
+    # Hour limits
+    for i, n in enumerate(nurse_list):
+        start, stop = nurse_ptr[i], nurse_ptr[i + 1]
+        row = pulp.LpAffineExpression(zip(x_vars[start:stop], hour_coefs[start:stop]))
+        model += row <= nurse_max_hours[i] + o[n], f"hour_limit_{n}"
+
+    return ScheduleModel(
+        model,
+        nurses,
+        shifts,
+        x,
+        o,
+        u,
+        preference_lookup,
+        nz_nurse,
+        nz_shift,
+        np.asarray(shift_demand),
+        threading.Lock(),
     )
 
-    # Constraints
-    # Shift coverage
-    for s in shifts:
-        model += pulp.lpSum(x[n][s] for n in nurses) + u[s] >= shift_demand[s], f"coverage_{s}"
-        if not allow_understaff:
-            model += u[s] == 0, f"no_understaff_{s}"
-
-    # Availability and skill
-    for n in nurses:
-        for s in shifts:
-            avail = availability_lookup.get((n, s), 0)
-            model += x[n][s] <= avail, f"availability_{n}_{s}"
-            if shift_skill[s].upper() == "ICU" and nurse_skill[n].upper() != "ICU":
-                model += x[n][s] == 0, f"skill_{n}_{s}"
 
-    # Hour limits
-    for n in nurses:
-        max_hours = nurse_max_hours[n]
-        model += (
-            pulp.lpSum(shift_hours[s] * x[n][s] for s in shifts) <= max_hours + o[n],
-            f"hour_limit_{n}",
+def solve_model(
+    schedule_model: ScheduleModel,
+    overtime_cost: float = 10.0,
+    understaff_penalty: float = 50.0,
+    preference_weight: float = 0.0,
+    fast_lp: bool = False,
+):
+    """
+    Set the weighted objective on a built model, solve it and extract results.
+
+    With ``fast_lp`` the LP relaxation is solved first and used as-is when
+    every assignment comes out integral; otherwise the MILP is solved.
+
+    Holds the model's lock from setting the objective through reading the
+    solution back, so a model shared between threads (e.g. a cached one)
+    is never solved or read concurrently.
+
+    Returns the same tuple as ``optimize_schedule``.
+    """
+    with schedule_model.lock:
+        return _solve_locked(schedule_model, overtime_cost, understaff_penalty, preference_weight, fast_lp)
+
+
+def _solve_locked(
+    schedule_model: ScheduleModel,
+    overtime_cost: float,
+    understaff_penalty: float,
+    preference_weight: float,
+    fast_lp: bool,
+):
+    """Body of ``solve_model``; the caller must hold ``schedule_model.lock``."""
+    model, nurses, shifts, x, o, u, preference_lookup, nz_nurse, nz_shift, shift_demand, _ = schedule_model
+
+    # Objective: minimize total overtime + understaff penalty
+    # Preference scores act as a reward (subtracted from the objective).
+    objective = pulp.lpSum(overtime_cost * o[n] for n in nurses) + pulp.lpSum(
+        understaff_penalty * u[s] for s in shifts
+    )
+    if preference_weight != 0:
+        objective -= pulp.lpSum(
+            preference_weight * preference_lookup.get(key, 0.0) * var for key, var in x.items()
         )
-        if not allow_overtime:
-            model += o[n] == 0, f"no_overtime_{n}"
+    model.setObjective(objective)
 
-    # Solve with CBC
-    solver = pulp.PULP_CBC_CMD(msg=False)
-    model.solve(solver)
+    # Solve with HiGHS in-process when available, otherwise CBC
+    model.solve(_get_solver(mip=not fast_lp))
+    if fast_lp and model.status == pulp.LpStatusOptimal:
+        relaxed = np.fromiter((var.varValue or 0.0 for var in x.values()), dtype=np.float64, count=len(x))
+        if not np.all(np.abs(relaxed - np.round(relaxed)) < 1e-6):
+            # Fractional relaxation: fall back to branch-and-bound
+            model.solve(_get_solver())
     status = pulp.LpStatus[model.status]
 
-    # Extract results
-    assignment_rows = []
-    for n in nurses:
-        for s in shifts:
-            assignment_rows.append(
-                {"nurse_id": n, "shift_id": s, "assigned": int(pulp.value(x[n][s]))}
-            )
+    # Extract results: read every solved value in one pass, then scatter the
+    # sparse assignment vector into a dense nurse x shift matrix; its
+    # row-major ravel is the long-format column.
+    vals = {v.name: v.varValue for v in model.variables()}
+    assigned = np.fromiter((vals.get(var.name) or 0.0 for var in x.values()), dtype=np.float64, count=len(x))
+    assigned_matrix = np.zeros((len(nurses), len(shifts)), dtype=np.int8)
+    assigned_matrix[nz_nurse, nz_shift] = np.rint(assigned)
 
-    assignments_df = pd.DataFrame(assignment_rows)
-    overtime_dict = {n: float(pulp.value(o[n])) for n in nurses}
-    unmet_demand = {s: float(pulp.value(u[s])) for s in shifts}
+    assignments_df = pd.DataFrame(
+        {
+            "nurse_id": np.repeat(nurses, len(shifts)),
+            "shift_id": np.tile(shifts, len(nurses)),
+            "assigned": assigned_matrix.ravel(),
+        }
+    )
+    overtime_arr = _slack_values(vals, o, nurses)
+    unmet_arr = _slack_values(vals, u, shifts)
+    overtime_dict = dict(zip(nurses, overtime_arr.tolist()))
+    unmet_demand = dict(zip(shifts, unmet_arr.tolist()))
 
-    return assignments_df, overtime_dict, unmet_demand, status
+    return (
+        assignments_df,
+        overtime_dict,
+        unmet_demand,
+        status,
+        assigned_matrix,
+        np.asarray(nurses),
+        np.asarray(shifts),
+        shift_demand,
+    )
 
 
+def optimize_schedule(
+    nurses_df: pd.DataFrame,
+    shifts_df: pd.DataFrame,
+    availability_df: pd.DataFrame,
+    allow_overtime: bool = True,
+    overtime_cost: float = 10.0,
+    allow_understaff: bool = False,
+    understaff_penalty: float = 50.0,
+    preferences_df: pd.DataFrame | None = None,
+    preference_weight: float = 0.0,
+    fast_lp: bool = False,
+):
+    """
+    Build and solve the nurse scheduling MILP.
+
+    Set ``fast_lp`` to try the LP relaxation first; when capacity is ample it
+    is often already integral and branch-and-bound is skipped.
+
+    Returns
+    -------
+    assignments_df : pd.DataFrame
+        Columns: nurse_id, shift_id, assigned (0/1)
+    overtime_dict : dict
+        Mapping of nurse_id -> overtime hours (float)
+    unmet_demand : dict
+        Mapping of shift_id -> unmet headcount (float)
+    status : str
+        PuLP solver status string
+    assigned_matrix : np.ndarray
+        int8 array of shape (n_nurses, n_shifts), rows/columns in input order
+    nurse_index : np.ndarray
+        nurse_id for each row of ``assigned_matrix``
+    shift_index : np.ndarray
+        shift_id for each column of ``assigned_matrix``
+    shift_demand : np.ndarray
+        Demand per shift, aligned to ``shift_index`` (last row wins on duplicate ids)
+    """
+    schedule_model = build_model(
+        nurses_df,
+        shifts_df,
+        availability_df,
+        allow_overtime=allow_overtime,
+        allow_understaff=allow_understaff,
+        preferences_df=preferences_df,
+    )
+    return solve_model(
+        schedule_model,
+        overtime_cost=overtime_cost,
+        understaff_penalty=understaff_penalty,
+        preference_weight=preference_weight,
+        fast_lp=fast_lp,
+    )